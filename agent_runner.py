@@ -1,9 +1,7 @@
 from langchain.agents import initialize_agent, AgentType
-from langchain_ollama.llms import OllamaLLM
+from llm import llm
 from tools import tools
 
-llm = OllamaLLM(model="llama3.1")
-
 agent = initialize_agent(
     tools=tools,
     llm=llm,
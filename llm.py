@@ -0,0 +1,10 @@
+from langchain_ollama.llms import OllamaLLM
+
+# Shared LLM instance used by every agent, created once at import.
+# Explicit Q4_K_M quant, pull it first: ollama pull llama3.1:8b-instruct-q4_K_M
+llm = OllamaLLM(
+    model="llama3.1:8b-instruct-q4_K_M",
+    keep_alive="1h",
+    num_ctx=4096,
+    num_gpu=99,
+)
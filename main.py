@@ -1,9 +1,14 @@
+import asyncio
+import json
+import re
+from collections import OrderedDict
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from langchain.agents import AgentExecutor, Tool, ZeroShotAgent
 from langchain.chains import LLMChain
-from langchain_ollama.llms import OllamaLLM
 from langchain.prompts import PromptTemplate
+from llm import llm
 from tools import (
     rating_summary_tool,
     search_reviews_tool,
@@ -15,17 +20,46 @@ from tools import (
     most_mentioned_dish_tool,
     sentiment_trend_tool,
     send_mail_tool,
+    close_smtp,
+    reload_reviews_if_changed,
 )
 
 app = FastAPI()
 
-# Safe wrapper for tools to catch errors gracefully
-def safe_tool(tool_func):
+# How often to check the reviews CSV for changes, in seconds
+_RELOAD_INTERVAL = 30
+
+async def watch_reviews_csv():
+    while True:
+        await asyncio.sleep(_RELOAD_INTERVAL)
+        try:
+            await asyncio.to_thread(reload_reviews_if_changed)
+        except Exception as e:
+            print(f"[Reload Error] {str(e)}")
+
+@app.on_event("startup")
+async def start_reviews_watcher():
+    app.state.reviews_watcher = asyncio.create_task(watch_reviews_csv())
+
+@app.on_event("shutdown")
+def on_shutdown():
+    app.state.reviews_watcher.cancel()
+    close_smtp()
+
+# Upper bound on what a tool may add to the agent scratchpad
+_MAX_TOOL_OUT_CHARS = 1500
+
+# Safe wrapper for tools to catch errors gracefully; max_chars=None leaves
+# output uncapped for tools whose result goes straight to the user
+def safe_tool(tool_func, max_chars=_MAX_TOOL_OUT_CHARS):
     def wrapper(input_str):
         try:
-            return tool_func(input_str)
+            out = tool_func(input_str)
         except Exception as e:
             return f"[Tool Error] {str(e)}"
+        if max_chars is not None and len(out) > max_chars:
+            out = out[:max_chars] + "…"
+        return out
     return wrapper
 
 
@@ -34,7 +68,7 @@ def safe_tool(tool_func):
 review_tools = [
     Tool(name="RatingSummary", func=safe_tool(rating_summary_tool), description="Summarize overall customer sentiment from all reviews. Input is an empty string."),
     Tool(name="SearchReviews", func=safe_tool(search_reviews_tool), description="Search reviews for specific keywords. Input is a query string."),
-    Tool(name="FinalAnswer", func=safe_tool(final_answer_tool), description="Return the final answer to the user and stop the agent."),
+    Tool(name="FinalAnswer", func=safe_tool(final_answer_tool, max_chars=None), description="Return the final answer to the user and stop the agent.", return_direct=True),
     Tool(name="CountRating", func=safe_tool(count_rating_tool), description="Counts how many customers gave a specific rating. Input must be a string representing a number."),
     Tool(name="TopRatedComments", func=safe_tool(top_rated_comments_tool), description="Returns the top N reviews with a 5-star rating. Input is a number string like '3'."),
     Tool(name="LowRatedReasons", func=safe_tool(low_rated_reasons_tool), description="Returns common keywords found in 1-2 star reviews. Input is an empty string."),
@@ -43,8 +77,6 @@ review_tools = [
     Tool(name="SentimentTrend", func=safe_tool(sentiment_trend_tool), description="Returns the trend of average rating per month."),
 ]
 
-llm_review = OllamaLLM(model="llama3.1")
-
 tool_descriptions = "\n".join([f"- {tool.name}: {tool.description}" for tool in review_tools])
 
 prompt_review = ZeroShotAgent.create_prompt(
@@ -64,7 +96,7 @@ prompt_review = ZeroShotAgent.create_prompt(
     input_variables=["input", "agent_scratchpad"],
 )
 
-llm_chain_review = LLMChain(llm=llm_review, prompt=prompt_review)
+llm_chain_review = LLMChain(llm=llm, prompt=prompt_review)
 
 agent_review = ZeroShotAgent(llm_chain=llm_chain_review, tools=review_tools)
 
@@ -72,7 +104,9 @@ agent_executor = AgentExecutor.from_agent_and_tools(
     agent=agent_review,
     tools=review_tools,
     verbose=True,
-    max_iterations=10,
+    max_iterations=5,
+    max_execution_time=30,
+    early_stopping_method="force",
     handle_parsing_errors=True,
 )
 
@@ -82,11 +116,9 @@ agent_executor = AgentExecutor.from_agent_and_tools(
 # Mail agent tools
 mail_tools = [
     Tool(name="SendMail", func=safe_tool(send_mail_tool), description="Send an email with given content. Input should be the email details as JSON string."),
-    Tool(name="FinalAnswer", func=lambda x: x, description="Return the final answer to the user and stop the agent."),
+    Tool(name="FinalAnswer", func=lambda x: x, description="Return the final answer to the user and stop the agent.", return_direct=True),
 ]
 
-llm_mail = OllamaLLM(model="llama3.1")
-
 tool_descriptions_mail = "\n".join([f"- {tool.name}: {tool.description}" for tool in mail_tools])
 
 prompt_mail = ZeroShotAgent.create_prompt(
@@ -112,7 +144,7 @@ prompt_mail = ZeroShotAgent.create_prompt(
     input_variables=["input", "agent_scratchpad"],
 )
 
-llm_chain_mail = LLMChain(llm=llm_mail, prompt=prompt_mail)
+llm_chain_mail = LLMChain(llm=llm, prompt=prompt_mail)
 
 agent_mail = ZeroShotAgent(llm_chain=llm_chain_mail, tools=mail_tools)
 
@@ -127,8 +159,6 @@ mail_agent_executor = AgentExecutor.from_agent_and_tools(
 
 ### INTENT CLASSIFIER SETUP ###
 
-intent_classifier_llm = OllamaLLM(model="llama3.1")
-
 intent_prompt_template = PromptTemplate(
     input_variables=["user_input"],
     template=(
@@ -138,12 +168,39 @@ intent_prompt_template = PromptTemplate(
     )
 )
 
+# Cheap keyword router; the LLM is only consulted when this is ambiguous
+MAIL_RE = re.compile(r"\b(?:e-?mail|mail|send|recipient|smtp|subject)\b|@", re.I)
+REVIEW_RE = re.compile(r"\b(?:reviews?|ratings?|stars?|customers?|dish(?:es)?|sentiment)\b", re.I)
+
+def classify_intent_keywords(user_input: str) -> str | None:
+    mail_hits = len(MAIL_RE.findall(user_input))
+    review_hits = len(REVIEW_RE.findall(user_input))
+    # Mail instructions often mention reviews too, so only one-sided hits are trusted
+    if mail_hits and not review_hits:
+        return "Mail"
+    if review_hits and not mail_hits:
+        return "Review"
+    return None
+
+# LRU of intents the LLM resolved, keyed by the raw user input
+_INTENT_CACHE_SIZE = 1024
+_intent_cache = OrderedDict()
+
 async def classify_intent_llm(user_input: str) -> str:
+    intent = classify_intent_keywords(user_input)
+    if intent:
+        return intent
+    if user_input in _intent_cache:
+        _intent_cache.move_to_end(user_input)
+        return _intent_cache[user_input]
     prompt = intent_prompt_template.format(user_input=user_input)
-    response = await intent_classifier_llm.apredict(prompt)
+    response = await llm.apredict(prompt)
     intent = response.strip().capitalize()
     if intent not in ["Review", "Mail"]:
-        intent = "Unknown"
+        return "Unknown"
+    _intent_cache[user_input] = intent
+    if len(_intent_cache) > _INTENT_CACHE_SIZE:
+        _intent_cache.popitem(last=False)
     return intent
 
 
@@ -155,22 +212,71 @@ class QuestionRequest(BaseModel):
 class SmartRequest(BaseModel):
     prompt: str
 
+class BatchRequest(BaseModel):
+    questions: list[str] = Field(max_length=20)
+
 
 ### API ENDPOINTS ###
 
 @app.post("/ask")
 async def ask_agent_endpoint(request: QuestionRequest):
     try:
-        response = agent_executor.run(request.question)
+        response = await agent_executor.arun(request.question)
         return {"answer": response}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/ask_stream")
+async def ask_stream_endpoint(request: QuestionRequest):
+    # Server-sent events: LLM tokens as they are generated, each tool call and
+    # observation, then the final answer
+    async def events():
+        try:
+            async for event in agent_executor.astream_events({"input": request.question}, version="v2"):
+                kind = event["event"]
+                if kind == "on_llm_stream":
+                    yield f"data: {json.dumps({'token': event['data']['chunk'].text})}\n\n"
+                elif kind == "on_tool_start":
+                    tool_event = {"tool": event["name"], "tool_input": event["data"].get("input")}
+                    yield f"data: {json.dumps(tool_event, default=str)}\n\n"
+                elif kind == "on_tool_end":
+                    yield f"data: {json.dumps({'observation': str(event['data'].get('output'))})}\n\n"
+                elif kind == "on_chain_end" and not event["parent_ids"]:
+                    yield f"data: {json.dumps({'answer': event['data']['output']['output']})}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# Agent loops of one /ask_batch request allowed to hit the LLM at the same time
+_BATCH_CONCURRENCY = 4
+
+@app.post("/ask_batch")
+async def ask_batch_endpoint(request: BatchRequest):
+    try:
+        semaphore = asyncio.Semaphore(_BATCH_CONCURRENCY)
+
+        async def run(question):
+            async with semaphore:
+                return await agent_executor.arun(question)
+
+        # One failing question must not discard the other answers
+        responses = await asyncio.gather(*(run(q) for q in request.questions), return_exceptions=True)
+        answers = [
+            f"[Agent Error] {str(r)}" if isinstance(r, BaseException) else r
+            for r in responses
+        ]
+        return {"answers": answers}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/sendmail")
 async def send_mail_endpoint(request: QuestionRequest):
     try:
-        response = mail_agent_executor.run(request.question)
+        response = await mail_agent_executor.arun(request.question)
         return {"answer": response}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -181,9 +287,9 @@ async def smart_router(request: SmartRequest):
     try:
         intent = await classify_intent_llm(request.prompt)
         if intent == "Review":
-            result = agent_executor.run(request.prompt)
+            result = await agent_executor.arun(request.prompt)
         elif intent == "Mail":
-            result = mail_agent_executor.run(request.prompt)
+            result = await mail_agent_executor.arun(request.prompt)
         else:
             result = "Sorry, I couldn't understand if this is about reviews or sending mail."
         return {"intent": intent, "result": result}
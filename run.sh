@@ -0,0 +1,4 @@
+#!/bin/sh
+# Serve the API with several uvicorn worker processes (default: 2 * CPUs + 1)
+WORKERS=${WEB_CONCURRENCY:-$((2 * $(nproc) + 1))}
+exec gunicorn main:app -k uvicorn.workers.UvicornWorker -w "$WORKERS" -b "${HOST:-0.0.0.0}:${PORT:-8000}" --timeout 120
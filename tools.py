@@ -1,122 +1,280 @@
 import csv
-from collections import defaultdict
+import re
+from collections import Counter, defaultdict
 from datetime import datetime
+from functools import lru_cache, wraps
 import smtplib
 from email.message import EmailMessage
 import json
 import os
+import threading
 from dotenv import load_dotenv
-# Load your CSV reviews once, at module import
-reviews_data = []
+# Load your CSV reviews once, at module import, as one list per column
+titles = []
+dates = []
+ratings = []  # int rating, or None when the CSV value is not a number
+reviews = []
+reviews_lower = []
+months = []  # "YYYY-MM", or None when the date does not parse
+date_counts = Counter()
+reviews_by_rating = defaultdict(list)  # rating -> review indices in CSV order
+postings = defaultdict(list)  # lowercased word -> indices of reviews containing it
+# Tool answers that only depend on the CSV, computed once per load
+low_rated_reasons = ""
+most_mentioned_dish = ""
+sentiment_trend = ""
+# Path and modification time of the currently loaded CSV
+reviews_csv_path = None
+reviews_csv_mtime = None
 
 load_dotenv()
 
 gmail_user = os.getenv("GMAIL_USER")
 gmail_password = os.getenv("GMAIL_PASSWORD")
 
+# One authenticated SMTP connection reused across send_mail_tool calls
+_smtp = None
+_smtp_lock = threading.Lock()
+
+
+# Keep tool output short, it is fed back into every following agent prompt
+_MAX_REVIEW_CHARS = 200
+
+_TOKEN_RE = re.compile(r"\w+")
+# Whole words of letters only (any script); words joined to digits or an apostrophe,
+# like "didn't", are skipped as the old isalpha() check did instead of split apart
+_WORD_RE = re.compile(r"(?<![\w'’])[^\W\d_]+(?![\w'’])")
+
+# Guards swapping in a freshly loaded CSV against tools reading the columns
+_reviews_lock = threading.RLock()
+_cached_tools = []
+
+def _cached_tool(tool_func):
+    # The lock is taken outside the cache so a result computed from the old
+    # columns can never be stored after a reload has cleared the cache
+    cached = lru_cache(maxsize=256)(tool_func)
+
+    @wraps(tool_func)
+    def wrapper(*args):
+        with _reviews_lock:
+            return cached(*args)
+    wrapper.cache_clear = cached.cache_clear
+    _cached_tools.append(wrapper)
+    return wrapper
+
+def _parse_rating(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _parse_month(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m")
+    except (TypeError, ValueError):
+        return None
 
 def load_reviews_from_csv(file_path="realistic_restaurant_reviews.csv"):
+    global titles, dates, ratings, reviews, reviews_lower, months, date_counts
+    global reviews_by_rating, postings, low_rated_reasons, most_mentioned_dish, sentiment_trend
+    global reviews_csv_path, reviews_csv_mtime
+    # Parse into fresh structures and only swap them in once the whole file is good
+    mtime = os.path.getmtime(file_path)
+    new_titles, new_dates, new_ratings, new_reviews, new_reviews_lower, new_months = [], [], [], [], [], []
     with open(file_path, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        idx = {name: i for i, name in enumerate(header)}
+        title_i, date_i, rating_i, review_i = idx["Title"], idx["Date"], idx["Rating"], idx["Review"]
         for row in reader:
-            reviews_data.append(row)
+            # Skip blank lines like csv.DictReader did and pad short rows with empty fields
+            if not row:
+                continue
+            if len(row) < len(header):
+                row += [""] * (len(header) - len(row))
+            new_titles.append(row[title_i])
+            new_dates.append(row[date_i])
+            new_ratings.append(_parse_rating(row[rating_i]))
+            new_reviews.append(row[review_i])
+            new_reviews_lower.append(row[review_i].lower())
+            new_months.append(_parse_month(row[date_i]))
+    new_reviews_by_rating = defaultdict(list)
+    for i, rating in enumerate(new_ratings):
+        new_reviews_by_rating[rating].append(i)
+    new_postings = defaultdict(list)
+    for i, text in enumerate(new_reviews_lower):
+        for token in set(_TOKEN_RE.findall(text)):
+            new_postings[token].append(i)
+    new_low_rated_reasons, new_most_mentioned_dish = _word_stats(new_ratings, new_reviews_lower)
+    new_sentiment_trend = _sentiment_trend(new_months, new_ratings)
+
+    with _reviews_lock:
+        titles, dates, ratings, reviews = new_titles, new_dates, new_ratings, new_reviews
+        reviews_lower, months = new_reviews_lower, new_months
+        date_counts = Counter(new_dates)
+        reviews_by_rating, postings = new_reviews_by_rating, new_postings
+        low_rated_reasons, most_mentioned_dish = new_low_rated_reasons, new_most_mentioned_dish
+        sentiment_trend = new_sentiment_trend
+        for tool in _cached_tools:
+            tool.cache_clear()
+        reviews_csv_path, reviews_csv_mtime = file_path, mtime
+
+def _word_stats(ratings, reviews_lower):
+    keywords = Counter()
+    word_freq = Counter()
+    for rating, text in zip(ratings, reviews_lower):
+        words = _WORD_RE.findall(text)
+        if rating in (1, 2):
+            keywords.update(words)
+        word_freq.update(word for word in words if len(word) > 3)
+    top_keywords = keywords.most_common(5)
+    low_rated = f"Common keywords in low-rated reviews: {', '.join(word for word, _ in top_keywords)}"
+    if word_freq:
+        top_word = word_freq.most_common(1)[0]
+        most_mentioned = f"The most mentioned term in reviews is '{top_word[0]}' with {top_word[1]} mentions."
+    else:
+        most_mentioned = "No mentions found."
+    return low_rated, most_mentioned
+
+def _sentiment_trend(months, ratings):
+    month_stats = defaultdict(lambda: [0, 0])  # month -> [rating sum, count]
+    for month, rating in zip(months, ratings):
+        if month is not None and rating is not None:
+            month_stats[month][0] += rating
+            month_stats[month][1] += 1
+    trend = [
+        f"{month}: {total / count:.2f}"
+        for month, (total, count) in sorted(month_stats.items())
+    ]
+    return "Sentiment trend by month:\n" + "\n".join(trend)
+
+def reload_reviews(file_path="realistic_restaurant_reviews.csv"):
+    load_reviews_from_csv(file_path)
+
+def reload_reviews_if_changed():
+    if os.path.getmtime(reviews_csv_path) == reviews_csv_mtime:
+        return False
+    reload_reviews(reviews_csv_path)
+    return True
 
 load_reviews_from_csv()
 
+def _format_review(i):
+    text = reviews[i]
+    if len(text) > _MAX_REVIEW_CHARS:
+        text = text[:_MAX_REVIEW_CHARS] + "…"
+    return f"{titles[i]} ({dates[i]}): {text}"
+
+@_cached_tool
 def rating_summary_tool(_input: str) -> str:
     print("Called rating_summary_tool")
     # Simple summary example: average rating and count
-    total_rating = 0
-    count = 0
-    for review in reviews_data:
-        try:
-            total_rating += int(review["Rating"])
-            count += 1
-        except:
-            pass
-    avg_rating = total_rating / count if count else 0
+    valid = [r for r in ratings if r is not None]
+    count = len(valid)
+    avg_rating = sum(valid) / count if count else 0
 
     summary = f"There are {count} reviews with an average rating of {avg_rating:.1f} stars."
     return summary
 
+def _search_candidates(query):
+    # Every word of a matching query occurs inside some word of the review, so the
+    # reviews posted under words containing the query's longest word cover all matches.
+    # They come back in CSV order so the first 3 verified hits equal a full scan's.
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return range(len(reviews_lower))
+    token = max(tokens, key=len)
+    words = [word for word in postings if token in word]
+    if sum(len(postings[word]) for word in words) > len(reviews_lower):
+        # Common fragments like "a": a scan finds 3 matches almost immediately
+        return range(len(reviews_lower))
+    candidates = set()
+    for word in words:
+        candidates.update(postings[word])
+    return sorted(candidates)
+
+@_cached_tool
 def search_reviews_tool(query: str) -> str:
     print(f"Called search_reviews_tool with query: {query}")
+    query = query.lower()
     results = []
-    for review in reviews_data:
-        if query.lower() in review["Review"].lower():
-            results.append(f"{review['Title']} ({review['Date']}): {review['Review']}")
+    for i in _search_candidates(query):
+        if query in reviews_lower[i]:
+            results.append(_format_review(i))
+            # Return up to first 3 matches to keep output manageable
+            if len(results) == 3:
+                break
     if not results:
         return "No reviews found matching your query."
-    # Return up to first 3 matches to keep output manageable
-    return "\n\n".join(results[:3])
+    return "\n\n".join(results)
 
+@_cached_tool
 def count_rating_tool(rating_str: str) -> str:
     try:
         rating = int(rating_str.strip())
     except Exception:
         return "Invalid input. Please provide a number like '5'."
 
-    count = sum(1 for review in reviews_data if str(review.get("Rating", "")).strip() == str(rating))
+    count = len(reviews_by_rating.get(rating, ()))
     return f"{count} customers gave a {rating}-star rating."
 
+@_cached_tool
 def top_rated_comments_tool(n: str) -> str:
     try:
         n = int(n)
     except:
         return "Please provide a number like '3' to get top rated comments."
     
-    top_reviews = [
-        review for review in reviews_data
-        if str(review.get("Rating", "")).strip() == "5"
-    ]
-    top_reviews = top_reviews[:n]
-    return "\n\n".join(f"{r['Title']} ({r['Date']}): {r['Review']}" for r in top_reviews) if top_reviews else "No top rated reviews found."
+    top_reviews = reviews_by_rating.get(5, [])[:n]
+    return "\n\n".join(_format_review(i) for i in top_reviews) if top_reviews else "No top rated reviews found."
 
 def low_rated_reasons_tool(_input: str = "") -> str:
-    keywords = {}
-    for review in reviews_data:
-        rating = review.get("Rating", "").strip()
-        if rating in ["1", "2"]:
-            for word in review["Review"].lower().split():
-                word = word.strip(".,!?()")
-                if word.isalpha():
-                    keywords[word] = keywords.get(word, 0) + 1
-    sorted_keywords = sorted(keywords.items(), key=lambda x: x[1], reverse=True)[:5]
-    return f"Common keywords in low-rated reviews: {', '.join(word for word, _ in sorted_keywords)}"
+    return low_rated_reasons
 
 def review_count_by_date_tool(date: str) -> str:
-    count = sum(1 for review in reviews_data if review.get("Date") == date)
+    count = date_counts.get(date, 0)
     return f"{count} reviews were posted on {date}."
 
 def most_mentioned_dish_tool(_input: str = "") -> str:
-    word_freq = {}
-    for review in reviews_data:
-        for word in review["Review"].lower().split():
-            word = word.strip(".,!?()")
-            if word.isalpha() and len(word) > 3:
-                word_freq[word] = word_freq.get(word, 0) + 1
-    if not word_freq:
-        return "No mentions found."
-    top_word = max(word_freq.items(), key=lambda x: x[1])
-    return f"The most mentioned term in reviews is '{top_word[0]}' with {top_word[1]} mentions."
+    return most_mentioned_dish
 
 def sentiment_trend_tool(_input: str = "") -> str:
-    ratings_by_month = defaultdict(list)
-    for review in reviews_data:
+    return sentiment_trend
+
+
+def _get_smtp():
+    global _smtp
+    if _smtp is not None:
         try:
-            date_obj = datetime.strptime(review["Date"], "%Y-%m-%d")
-            month = date_obj.strftime("%Y-%m")
-            rating = int(review["Rating"])
-            ratings_by_month[month].append(rating)
-        except:
-            continue
-    sorted_months = sorted(ratings_by_month.keys())
-    trend = [
-        f"{month}: {sum(ratings_by_month[month]) / len(ratings_by_month[month]):.2f}"
-        for month in sorted_months
-    ]
-    return "Sentiment trend by month:\n" + "\n".join(trend)
+            if _smtp.noop()[0] == 250:
+                return _smtp
+        except (smtplib.SMTPException, OSError):
+            pass
+        _close_smtp()
+    # Setup SMTP server (example using Gmail SMTP)
+    smtp = smtplib.SMTP_SSL("smtp.gmail.com", 465)
+    try:
+        smtp.login(gmail_user, gmail_password)
+    except Exception:
+        smtp.close()
+        raise
+    _smtp = smtp
+    return _smtp
 
+def close_smtp():
+    with _smtp_lock:
+        _close_smtp()
+
+def _close_smtp():
+    # Caller must hold _smtp_lock
+    global _smtp
+    if _smtp is None:
+        return
+    try:
+        _smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        pass
+    _smtp = None
 
 def send_mail_tool(input_str: str) -> str:
     """
@@ -140,10 +298,12 @@ def send_mail_tool(input_str: str) -> str:
         msg["Subject"] = subject
         msg.set_content(body)
 
-        # Setup SMTP server (example using Gmail SMTP)
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(gmail_user, gmail_password) 
-            smtp.send_message(msg)
+        with _smtp_lock:
+            try:
+                _get_smtp().send_message(msg)
+            except Exception:
+                _close_smtp()
+                raise
 
         return f"Email sent successfully to {to_addr}"
     except Exception as e: